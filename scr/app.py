@@ -1,6 +1,6 @@
 import streamlit as st
 import folium
-from streamlit_folium import folium_static
+import streamlit.components.v1 as components
 from folium.plugins import MousePosition
 import pandas as pd
 import os
@@ -8,6 +8,177 @@ from vizualize import *
 from func import *
 from bigImage import BigImage
 
+
+@st.cache_resource
+def load_matrix():
+    """
+    Load the distance matrix once and share it across all reruns and user sessions.
+
+    Returns:
+        tuple: The euclidean distance matrix between all samples as a NumPy array 
+               and the dictionary mapping every sample ID to its rows.
+    """
+    return load_dist_matrix(os.getcwd() + "/1_dist_matrix")
+
+
+@st.cache_data(show_spinner=False)
+def load_samples(number_of_bins, resolution, same_age_range):
+    """
+    Label the samples with their time bins and hexagons once per setting and share them across all user sessions.
+    
+    Returns:
+        pd.DataFrame: The samples with the added age group and hexagon columns.
+    """
+    return label_samples(os.getcwd(), number_of_bins, resolution, same_age_range)
+
+
+@st.cache_data(show_spinner=False)
+def compute_time_bins_dist(number_of_bins, resolution, same_age_range):
+    """
+    Calculate the average distances between neighboring hexagons for each time bin once per setting
+    and share them across all user sessions.
+    
+    Returns:
+        tuple: The average distances between neighboring hexagons and the number of samples per hexagon for each time bin.
+    """
+    df = load_samples(number_of_bins, resolution, same_age_range)
+    return calc_dist_time_bin(df, *load_matrix())
+
+
+@st.cache_data(show_spinner=False)
+def prepare_time_bin(time_bin_id, number_of_bins, resolution, same_age_range, _time_bin):
+    """
+    Scale the distances of a time bin and get its hexagons.
+    
+    The argument starting with an underscore is not hashed by Streamlit, it is fully
+    determined by the selected time bin and the settings chosen on the home screen.
+    
+    Returns:
+        tuple: The time bin with the distances between hexagons, the predicted distances 
+               used to scale the internal distances and the hexagons with their internal distance.
+    """
+    # scale the distances to their geographical distance and save the predicted distances to scale the internal distances with it
+    time_bin, gen_distances_pred = scale_distances(_time_bin, resolution=resolution)
+    # get the hexagons with there internal distance and the distance values for the selected time bin
+    time_bin, hexagons = get_hexagons(time_bin)
+    
+    return time_bin, gen_distances_pred, hexagons
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def compute_barriers(time_bin_id, number_of_bins, resolution, same_age_range, isolated_threshold, allowed_distance, _time_bin, _hexagons, _gen_distances_pred, _df):
+    """
+    Compute the isolated hexagons, the barriers and the closest populations for a time bin.
+    
+    The arguments starting with an underscore are not hashed by Streamlit, they are fully
+    determined by the selected time bin and the settings chosen on the home screen.
+    
+    Returns:
+        tuple: The isolated hexagons, barrier lines, barrier hexagons, the time bin within the 
+               allowed distance, the imputed hexagons and the closest populations.
+    """
+    # get the isolated hexagons and the barrier lines for the selected time bin
+    isolated_hex, barrier_lines, barrier_hex, new_time_bin = get_isolated_hex_and_barriers(_time_bin, _hexagons, isolated_threshold, allowed_distance)
+    # impute the missing hexagons until a range of 2 times the resolution is reached
+    imputed_hex = impute_missing_hexagons(barrier_hex, num_runs=resolution * 2)
+    # find the closest populations to the isolated populations
+    closest_populations, isolated_hex = find_closest_population(
+        _df, time_bin_id, isolated_hex, *load_matrix(), isolated_threshold, _gen_distances_pred, resolution)
+    
+    return isolated_hex, barrier_lines, barrier_hex, new_time_bin, imputed_hex, closest_populations
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_sample_features(time_bin_key, _hexagons, _selected_df):
+    """
+    Create the GeoJson features of the sample hexagons, with the tables of their samples, once per time bin.
+    
+    The arguments starting with an underscore are not hashed by Streamlit, they are fully
+    determined by the time_bin_key, which holds the selected time bin and the settings chosen on the home screen.
+    
+    Returns:
+        list: The GeoJson features of the sample hexagons.
+    """
+    return get_sample_hexagon_features(_hexagons, _selected_df)
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_map(map_key, lat, lon, zoom, map_tiles, threshold, show_lines, show_sample_hexagons, _hexagons, _selected_df, _samples_per_hexagon, _barrier_hex, _imputed_hex, _barrier_lines, _new_time_bin):
+    """
+    Build the folium map for the selected time bin and render it to HTML.
+    
+    The arguments starting with an underscore are not hashed by Streamlit, they are fully
+    determined by the map_key, which holds the selected time bin and the settings used to compute it.
+    
+    Returns:
+        str: The HTML of the map.
+    """
+    m = folium.Map(location=(lat, lon), tiles=map_tiles, zoom_start=zoom, prefer_canvas=True)
+    # The sample hexagons only depend on the time bin, not on the thresholds or the map window
+    sample_features = build_sample_features(map_key[:4], _hexagons, _selected_df)
+
+    # Draw lines or hexagons based on the selected options
+    if show_lines:
+        m = draw_sample_hexagons(_hexagons, _selected_df, _samples_per_hexagon, m, zoom_start=zoom, show_samples_per_hexagon=show_sample_hexagons, features=sample_features)
+        # use the new time bin to only show distnaces that are in the allowed distance
+        lines = get_distance_lines(_new_time_bin)
+        m = draw_barriers(lines, m, threshold=-10.0)
+    else:
+        m = draw_hexagons_with_values(_barrier_hex, m, threshold=threshold, opacity=0.4)
+        m = draw_hexagons_with_values(_imputed_hex, m, threshold=threshold, imputed=True, opacity=0.4)
+        m = draw_sample_hexagons(_hexagons,  _selected_df, _samples_per_hexagon, m, zoom_start=zoom, show_samples_per_hexagon=show_sample_hexagons, features=sample_features)
+
+    # Draw migration routes if selected
+    # for now this functionality is removed
+    #if st.session_state['show_migration']:
+    #    m = draw_migration_for_time_bin(closest_populations, m)
+    #    m = draw_sample_hexagons(_hexagons, _selected_df, _samples_per_hexagon, m, zoom_start=zoom)
+    
+    # Draw isolated populations if selected
+    # for now this functionality is removed
+    #if st.session_state['show_isolated']:
+    #    m = draw_hexagons(isolated_hex, m, color="black", opacity=0.6)
+    #    m = draw_sample_hexagons(_hexagons, _selected_df, _samples_per_hexagon, m, zoom_start=zoom)
+        
+    # Draw barriers if there are any
+    if len(_barrier_lines) > 0:
+        m = draw_barriers(_barrier_lines, m, threshold=threshold)
+    
+    # Add the download button for the map
+    big_image = BigImage()
+    m.add_child(big_image)
+    
+    # Add fullscreen button
+    folium.plugins.Fullscreen(
+    position="bottomleft",
+    title="Expand me",
+    title_cancel="Exit me",
+    force_separate_button=True,
+    ).add_to(m)
+    
+    # Add mouse position to the map
+    MousePosition().add_to(m)
+    
+    # Add the legend to the map
+    m = add_legend(m)
+    
+    return folium.Figure().add_child(m).render()
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_deck(map_key, lat, lon, zoom, threshold, _barrier_hex, _imputed_hex, _hexagons):
+    """
+    Build the Deck.gl map for the selected time bin.
+    
+    The arguments starting with an underscore are not hashed by Streamlit, they are fully
+    determined by the map_key, which holds the selected time bin and the settings used to compute it.
+    
+    Returns:
+        pydeck.Deck: The Deck object with the plotted hexagons.
+    """
+    return draw_hexagons_deck(_barrier_hex, _imputed_hex, _hexagons.keys(), lat, lon, zoom, threshold)
+
+
 def clear_state():
     """
     Clear all keys from the Streamlit session state.
@@ -77,9 +248,8 @@ def initialize_session():
     if st.button('Run'):
         st.text('Running STARGEN...')
         st.session_state['setup_done'] = True
-        # Load the distance matrix to the session state
-        path_to_matrix = os.getcwd() + "/1_dist_matrix/eucl_dist.pkl"
-        st.session_state['matrix'] = pd.read_pickle(path_to_matrix)
+        # Load the distance matrix into the shared cache
+        load_matrix()
         st.rerun()
         
 
@@ -92,62 +262,47 @@ def setup_done_ui():
         clear_state()
         st.rerun()
 
-    # Label the samples and save them in a DataFrame
-    if 'df' not in st.session_state:
-        st.session_state['df'] = label_samples(os.getcwd(), st.session_state['time_bins'], st.session_state['resolution'], st.session_state['same_age_range'])
+    # Label the samples, the DataFrame is cached and shared instead of being stored in every session
+    df = load_samples(st.session_state['time_bins'], st.session_state['resolution'], st.session_state['same_age_range'])
     
-    # Calculate the average distances between neighboring hexagons for each time bin
-    if 'time_bins_dist' not in st.session_state:
-        st.session_state['time_bins_dist'], st.session_state['samples_per_hexagon'] = calc_dist_time_bin(st.session_state['df'], st.session_state['matrix'])
+    # Calculate the average distances between neighboring hexagons for each time bin, they are only recomputed if the settings change
+    time_bins_dist, samples_per_hexagon = compute_time_bins_dist(st.session_state['time_bins'], st.session_state['resolution'], st.session_state['same_age_range'])
     
     # Rename the time bins to display them in the dropdown
-    time_bins, time_bin_dict = rename_time_bins(st.session_state['df'])
+    time_bins, time_bin_dict = rename_time_bins(df)
     selected_time_bin = st.selectbox("Time Bin", options=time_bins)
-
-    if 'selected_time_bin_id' not in st.session_state:
-        st.session_state['selected_time_bin_id'] = 1
-    
     # get the id of the selected time bin
-    new_selected_time_bin_id = time_bins.index(selected_time_bin)
+    selected_time_bin_id = time_bins.index(selected_time_bin)
+
     # get the time bin and the hexagons for the selected time bin
-    time_bin = st.session_state['time_bins_dist'][selected_time_bin]
-    samples_per_hexagon = st.session_state['samples_per_hexagon'][selected_time_bin]
-    # scale the distances to their geographical distance and save the predicted distances to scale the internal distances with it
-    time_bin, gen_distances_pred = scale_distances(time_bin, resolution=st.session_state['resolution'])
-    # get the hexagons with there internal distance and the distance values for the selected time bin
-    time_bin, hexagons = get_hexagons(time_bin)
+    samples_per_hexagon = samples_per_hexagon[selected_time_bin]
+    # scale the distances and get the hexagons, they are only recomputed if the time bin or the settings change
+    time_bin, gen_distances_pred, hexagons = prepare_time_bin(
+        selected_time_bin_id, st.session_state['time_bins'], st.session_state['resolution'], st.session_state['same_age_range'],
+        time_bins_dist[selected_time_bin])
+
+    # Initialize thresholds for distance values, isolated populations and the neighborhood size
+    st.session_state.setdefault('threshold', -5.0)
+    st.session_state.setdefault('isolated_threshold', 1.0)
+    st.session_state.setdefault('allowed_distance', 15)
+
+    # Group the threshold sliders in a form, so the app only reruns once they are submitted
+    with st.sidebar.form("thresholds"):
+        # Slider to choose the threshold for the distance values to display
+        st.session_state['threshold'] = st.slider('Minimal distance value to display?', -5.0, 5.0, st.session_state['threshold'], 0.1)
+        
+        # Slider to choose the threshold for isolated populations
+        st.session_state['isolated_threshold'] = st.slider('Minimal distance value to be considered as isolated?', 0.0, 4.0, st.session_state['isolated_threshold'], 0.1)
+        
+        st.session_state['allowed_distance'] = st.slider('Number of hexagons to consider as neighborhood?', 1, 35, st.session_state['allowed_distance'])
+        st.form_submit_button("Update thresholds")
 
-    # Initialize thresholds for distance values and isolated populations
-    if 'threshold' not in st.session_state:
-        st.session_state['threshold'] = -5.0
-        st.session_state['isolated_threshold'] = 1.0
-
-    # Slider to choose the threshold for the distance values to display
-    st.session_state['threshold'] = st.sidebar.slider('Minimal distance value to display?', -5.0, 5.0, st.session_state['threshold'], 0.1)
-    
-    # Slider to choose the threshold for isolated populations
-    new_isolated_threshold = st.sidebar.slider('Minimal distance value to be considered as isolated?', 0.0, 4.0, st.session_state['isolated_threshold'], 0.1)
-    
-    new_allowed_distance = st.sidebar.slider('Number of hexagons to consider as neighborhood?', 1, 35, 15)
-
-    # Check if the threshold or the selected time bin has changed
-    if new_isolated_threshold != st.session_state['isolated_threshold'] or new_selected_time_bin_id != st.session_state['selected_time_bin_id'] or new_allowed_distance != st.session_state['allowed_distance']:
-        # save the new allowed distance 
-        st.session_state['allowed_distance'] = new_allowed_distance
-        # get the isolated hexagons and the barrier lines for the selected time bin
-        st.session_state['isolated_hex'], st.session_state['barrier_lines'], st.session_state['barrier_hex'], st.session_state['new_time_bin'] = get_isolated_hex_and_barriers(time_bin, hexagons, st.session_state['isolated_threshold'], st.session_state['allowed_distance'])
-        # impute the missing hexagons until a range of 2 times the resolution is reached
-        st.session_state['imputed_hex'] = impute_missing_hexagons(st.session_state['barrier_hex'], num_runs=st.session_state['resolution'] * 2)
-        # save the new threshold for isolated populations
-        st.session_state['isolated_threshold'] = new_isolated_threshold
-        # save the new selected time bin id
-        st.session_state['selected_time_bin_id'] = new_selected_time_bin_id
-        # save only all samples for the selected time bin
-        st.session_state['selected_df'] = st.session_state['df'][st.session_state['df']['AgeGroupTuple'] == time_bin_dict[selected_time_bin]]
-        # find the closest populations to the isolated populations
-        st.session_state['closest_populations'], st.session_state['isolated_hex'] = find_closest_population(
-            st.session_state['df'], st.session_state['selected_time_bin_id'], st.session_state['isolated_hex'], 
-            st.session_state['matrix'], st.session_state['isolated_threshold'], gen_distances_pred, st.session_state['resolution'])
+    # get the barriers for the selected time bin, they are only recomputed if the time bin or one of the settings changes
+    isolated_hex, barrier_lines, barrier_hex, new_time_bin, imputed_hex, closest_populations = compute_barriers(
+        selected_time_bin_id, st.session_state['time_bins'], st.session_state['resolution'], st.session_state['same_age_range'],
+        st.session_state['isolated_threshold'], st.session_state['allowed_distance'], time_bin, hexagons, gen_distances_pred, df)
+    # save only all samples for the selected time bin
+    selected_df = df[df['AgeGroupTuple'] == time_bin_dict[selected_time_bin]]
 
     # Checkbox to toggle showing sample hexagons
     st.session_state['show_sample_hexagons'] = st.sidebar.checkbox("Show sample hexagons", True)
@@ -164,67 +319,34 @@ def setup_done_ui():
     if 'map_state' not in st.session_state:
         st.session_state['map_state'] = {"lat": 42.0, "lon": 44.75, "zoom": 1}
 
-    st.sidebar.write("Specify a default window for the map:")
-    st.session_state['map_state']['lat'] = st.sidebar.number_input('Enter latitude:', -90.0, 90.0, step=0.01, value=st.session_state['map_state']['lat'])
-    st.session_state['map_state']['lon'] = st.sidebar.number_input('Enter longitude:', -180.0, 180.0, step=0.01, value=st.session_state['map_state']['lon'])
-    st.session_state['map_state']['zoom'] = st.sidebar.slider('Choose zoom level:', 1, 10, st.session_state['map_state']['zoom'])
+    # Group the map window inputs in a form, so the map is only rebuilt once they are submitted
+    with st.sidebar.form("map_window"):
+        st.write("Specify a default window for the map:")
+        st.session_state['map_state']['lat'] = st.number_input('Enter latitude:', -90.0, 90.0, step=0.01, value=st.session_state['map_state']['lat'])
+        st.session_state['map_state']['lon'] = st.number_input('Enter longitude:', -180.0, 180.0, step=0.01, value=st.session_state['map_state']['lon'])
+        st.session_state['map_state']['zoom'] = st.slider('Choose zoom level:', 1, 10, st.session_state['map_state']['zoom'])
+        st.form_submit_button("Update map")
 
     lat, lon, zoom = st.session_state['map_state'].values()
     map_tiles = "Esri worldstreetmap" if not st.sidebar.checkbox("Black and White Map", False) else "Cartodb Positron"
-    m = folium.Map(location=(lat, lon), tiles=map_tiles, zoom_start=zoom)
-
-    # Draw lines or hexagons based on the selected options
-    if st.session_state['show_lines']:
-        m = draw_sample_hexagons(hexagons, st.session_state['selected_df'], samples_per_hexagon, m, zoom_start=zoom, show_samples_per_hexagon=st.session_state['show_sample_hexagons'])
-        # use the new time bin to only show distnaces that are in the allowed distance
-        lines = get_distance_lines(st.session_state['new_time_bin'])
-        m = draw_barriers(lines, m, threshold=-10.0)
+    # Checkbox to render the hexagons on the GPU with Deck.gl instead of the folium map
+    use_deckgl = st.sidebar.checkbox("GPU rendering", False, help="Faster for many hexagons, but without the barrier lines and the map tools.")
+    # The selected time bin and the settings that the drawn data depends on
+    map_key = (selected_time_bin_id, st.session_state['time_bins'], st.session_state['resolution'], st.session_state['same_age_range'],
+               st.session_state['isolated_threshold'], st.session_state['allowed_distance'])
+    # Build the map, it is only rebuilt if one of the settings that affect it changes
+    if use_deckgl:
+        st.pydeck_chart(build_deck(map_key, lat, lon, zoom, st.session_state['threshold'], barrier_hex, imputed_hex, hexagons))
     else:
-        m = draw_hexagons_with_values(st.session_state['barrier_hex'], m, threshold=st.session_state['threshold'], opacity=0.4)
-        m = draw_hexagons_with_values(st.session_state['imputed_hex'], m, threshold=st.session_state['threshold'], imputed=True, opacity=0.4)
-        m = draw_sample_hexagons(hexagons,  st.session_state['selected_df'], samples_per_hexagon, m, zoom_start=zoom, show_samples_per_hexagon=st.session_state['show_sample_hexagons'])
-
-    # Draw migration routes if selected
-    # for now this functionality is removed
-    #if st.session_state['show_migration']:
-    #    m = draw_migration_for_time_bin(st.session_state['closest_populations'], m)
-    #    m = draw_sample_hexagons(hexagons, st.session_state['selected_df'], samples_per_hexagon, m, zoom_start=zoom)
-    
-    # Draw isolated populations if selected
-    # for now this functionality is removed
-    #if st.session_state['show_isolated']:
-    #    m = draw_hexagons(st.session_state['isolated_hex'], m, color="black", opacity=0.6)
-    #    m = draw_sample_hexagons(hexagons, st.session_state['selected_df'], samples_per_hexagon, m, zoom_start=zoom)
-        
-    # Draw barriers if there are any
-    if len(st.session_state['barrier_lines']) > 0:
-        m = draw_barriers(st.session_state['barrier_lines'], m, threshold=st.session_state['threshold'])
-    
-    # Add the download button for the map
-    big_image = BigImage()
-    m.add_child(big_image)
-    
-    # Add fullscreen button
-    folium.plugins.Fullscreen(
-    position="bottomleft",
-    title="Expand me",
-    title_cancel="Exit me",
-    force_separate_button=True,
-    ).add_to(m)
-    
-    # Add mouse position to the map
-    MousePosition().add_to(m)
-    
-    # Add the legend to the map
-    m = add_legend(m)
-    
-    folium_static(m, width=900, height=600)
+        map_html = build_map(map_key, lat, lon, zoom, map_tiles, st.session_state['threshold'], st.session_state['show_lines'], st.session_state['show_sample_hexagons'],
+                             hexagons, selected_df, samples_per_hexagon, barrier_hex, imputed_hex, barrier_lines, new_time_bin)
+        components.html(map_html, width=900, height=600 + 10)
     # for now this functionality is removed
-    #st.write(f"Number of isolated populations: {len(st.session_state['isolated_hex'])}")
+    #st.write(f"Number of isolated populations: {len(isolated_hex)}")
     
     # Button to display information about the number of samples in each time bin
     if st.button("Show table with number of samples per time bin"):
-        st.table(get_samples_per_time_bin(st.session_state['df']))
+        st.table(get_samples_per_time_bin(df))
 
 def main():
     """
@@ -1,4 +1,3 @@
-from branca.element import MacroElement
 from folium.elements import JSCSSMixin
 from branca.element import Template, MacroElement
 
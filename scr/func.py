@@ -1,12 +1,15 @@
+import os
 import pandas as pd
-import math
 import numpy as np
 import h3
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import compress
 import matplotlib.pyplot as plt
 from scipy.spatial import Delaunay
 import statsmodels.api as sm
-from haversine import haversine
+from haversine import haversine, haversine_vector
 
 def read_df(path):
     """
@@ -30,116 +33,208 @@ def read_df(path):
     return df
 
 
-def calc_avg_dist(samples_hex1, samples_hex2, dist_matrix):
+def load_dist_matrix(path):
     """
-    Calculates the average distance between two groups of samples.
+    Loads the distance matrix as a read-only memory map together with a lookup of the rows of every sample.
+
+    If only the legacy pickle file is found, or it is newer than the NumPy files, it is converted to the NumPy format,
+    so every following load can be memory-mapped instead of unpickled.
 
     Args:
-        samples_hex1 (list): List of sample identifiers for the first group.
-        samples_hex2 (list): List of sample identifiers for the second group.
-        dist_matrix (pd.DataFrame): DataFrame containing the distance matrix.
-    
+        path (str): Path to the directory containing the distance matrix files.
+
+    Returns:
+        tuple: A tuple containing:
+            - matrix (np.ndarray): The float32 distance matrix between all samples.
+            - id_to_rows (dict): Dictionary mapping every sample ID to an array of its rows in the matrix.
+    """
+    matrix_path = f'{path}/eucl_dist.npy'
+    ids_path = f'{path}/eucl_dist_ids.npy'
+    pickle_path = f'{path}/eucl_dist.pkl'
+    # Convert the legacy pickle file to the NumPy format if it is missing or out of date,
+    # float32 is precise enough for the distances
+    if not os.path.exists(matrix_path) or not os.path.exists(ids_path) or \
+            (os.path.exists(pickle_path) and os.path.getmtime(pickle_path) > os.path.getmtime(matrix_path)):
+        dist_df = pd.read_pickle(pickle_path)
+        # Store the matrix in C order, so the distances of a sample are contiguous on disk
+        arrays = {matrix_path: np.ascontiguousarray(dist_df.to_numpy(dtype=np.float32)),
+                  ids_path: dist_df.index.to_numpy(dtype=str)}
+        # Write both files to temporary names first and move them into place, so an interrupted
+        # or concurrent conversion never leaves a half written file behind
+        for file_path, array in arrays.items():
+            temp_path = f'{file_path}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as file:
+                np.save(file, array)
+            os.replace(temp_path, file_path)
+    # Map the matrix into memory so only the rows that are accessed get read from disk
+    matrix = np.load(matrix_path, mmap_mode='r')
+    # The matrix is always written in C order, the rows of the samples are read from it
+    if not matrix.flags['C_CONTIGUOUS']:
+        raise ValueError(f"The distance matrix {matrix_path} is not stored in C order, delete it to convert it again.")
+    ids = np.load(ids_path)
+    # The sample IDs have to belong to the matrix, one ID per row
+    if len(ids) != matrix.shape[0]:
+        raise ValueError(f"The distance matrix in {path} has {matrix.shape[0]} rows, but {len(ids)} sample IDs.")
+    # Map every sample ID to its rows, some sample IDs occur more than once
+    id_to_rows = pd.Series(ids).groupby(ids, sort=False).indices
+    return matrix, id_to_rows
+
+
+def get_sample_rows(id_to_rows, sample_ids):
+    """
+    Gets the rows of the distance matrix for a group of samples.
+
+    Args:
+        id_to_rows (dict): Dictionary mapping every sample ID to an array of its rows in the distance matrix.
+        sample_ids (list): List of sample identifiers.
+
+    Returns:
+        np.ndarray: The row positions of the samples, all rows are returned if a sample ID is duplicated.
+    """
+    missing = [sample for sample in sample_ids if sample not in id_to_rows]
+    if missing:
+        raise KeyError(f"The samples {missing} are missing from the distance matrix.")
+    if len(sample_ids) == 0:
+        return np.array([], dtype=np.intp)
+    return np.concatenate([id_to_rows[sample] for sample in sample_ids])
+
+
+def get_rows_in_hex(time_bin_df, hex_col, id_to_rows):
+    """
+    Gets the rows of the distance matrix for the samples in each hexagon.
+
+    Args:
+        time_bin_df (pd.DataFrame): DataFrame containing the samples with a column for hexagon IDs.
+        hex_col (str): Column name in time_bin_df that contains hexagon IDs.
+        id_to_rows (dict): Dictionary mapping every sample ID to an array of its rows in the distance matrix.
+
     Returns:
-        float: The average distance between the two groups of samples. 
+        dict: A dictionary where keys are hexagon IDs and values are arrays with the rows of their samples.
     """
-    return dist_matrix.loc[samples_hex1, samples_hex2].values.flatten().mean()
+    positions_in_hex = time_bin_df.groupby(hex_col).indices
+    ids = time_bin_df['ID'].to_numpy()
+    return {hexagon: get_sample_rows(id_to_rows, ids[positions]) for hexagon, positions in positions_in_hex.items()}
 
 
-def calc_neighbor_dist(hexagons, dist_matrix, time_bin_df, hex_col):
+def calc_neighbor_dist(hexagons, dist_matrix, rows_in_hex):
     """
     Calculate the average distances between neighboring hexagons.
 
     Parameters:
     - hexagons (list): List of hexagon IDs.
-    - dist_matrix (pd.DataFrame): A DataFrame representing the distance matrix.
-    - time_bin_df (pd.DataFrame): A DataFrame containing the Data for the time_bin with a column for hexagon IDs.
-    - hex_col (str): Column name in time_bin_df that contains hexagon IDs.
+    - dist_matrix (np.ndarray): The distance matrix as a NumPy array.
+    - rows_in_hex (dict): The rows of the distance matrix for the samples in each hexagon.
 
     Returns:
     - dict: A dictionary where keys are pairs of hexagons (as frozensets) and values are the average distances between them.
     """
 
-    # Get the samples in each hexagon
-    samples_in_hex = time_bin_df.groupby(hex_col)['ID'].apply(list).to_dict()
-    
-    # Create a list of all samples in the hexagons
-    all_samples = [sample for samples in samples_in_hex.values() for sample in samples]
-    
-    # Create a submatrix of the distance matrix for the samples in the hexagons
-    dist_matrix = dist_matrix.loc[all_samples, all_samples]
+    # Get the rows of all samples in the hexagons
+    all_rows = np.concatenate(list(rows_in_hex.values()))
+
+    # Create a submatrix of the distance matrix for the samples in the hexagons,
+    # the samples of each hexagon are a contiguous block of rows and columns in it
+    dist_matrix = dist_matrix[np.ix_(all_rows, all_rows)]
+    hex_index = {hexagon: i for i, hexagon in enumerate(rows_in_hex)}
+    sizes = np.array([len(rows) for rows in rows_in_hex.values()])
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+    # Sum every block of the submatrix in one pass over each axis, divided by the block sizes
+    # this gives the average distance between two hexagons
+    block_sums = np.add.reduceat(np.add.reduceat(dist_matrix, starts, axis=0, dtype=np.float64), starts, axis=1)
     
     # Initialize the dictionary to store the average distances between neighboring hexagons
     averages = {}
 
-    def get_neighbors(hexagons):
+    def get_neighbor_edges(hexagons):
         """
-        Get neighbors for all hexagons using Delaunay triangulation.
+        Get the pairs of neighboring hexagons using Delaunay triangulation.
 
         Parameters:
         - hexagons (list): List of hexagon IDs.
 
         Returns:
-        - dict: A dictionary where keys are hexagon IDs and values are lists of neighboring hexagon IDs.
+        - np.ndarray: An array with one row per pair of neighboring hexagons, holding their positions in hexagons.
         """
         # Get the centroid of each hexagon
-        coords = np.array([h3.cell_to_latlng(hex) for hex in hexagons])
-        hexagons = np.array(hexagons)
+        coords = np.array([get_hex_center(hex) for hex in hexagons])
         
         if len(coords) < 3:
-            # If there are less than 3 hexagons, return an empty dictionary
-            return {}
+            # If there are less than 3 hexagons, there are no neighbors
+            return np.empty((0, 2), dtype=int)
         
         # Calculate the Delaunay triangulation
         tri = Delaunay(coords)
 
-        # Get the edges (pairs of hexagons)
-        edges = set()
-        for simplex in tri.simplices:
-            for i in range(3):
-                edge = tuple(sorted((simplex[i], simplex[(i + 1) % 3])))
-                edges.add(edge)
-        
-        # Create the dictionary of neighbors
-        neighbors = {}
-        for i, j in edges:
-            neighbors.setdefault(hexagons[i], []).append(hexagons[j])
-            neighbors.setdefault(hexagons[j], []).append(hexagons[i])
-        
-        return neighbors
+        # Get the unique edges (pairs of hexagons) of all triangles at once
+        edges = tri.simplices[:, [[0, 1], [1, 2], [2, 0]]].reshape(-1, 2)
+        return np.unique(np.sort(edges, axis=1), axis=0)
 
     # Get the neighbors for whom we will calculate the distances
-    neighbors = get_neighbors(hexagons)
+    edges = get_neighbor_edges(hexagons)
+    num_hexagons = len(hexagons)
+    num_visits = edges.size
+
+    # Every edge is visited from both of its hexagons, and every hexagon visits itself after its neighbors
+    # to calculate the distance with itself
+    visitor = np.concatenate((edges.ravel(), np.arange(num_hexagons)))
+    visited = np.concatenate((edges[:, ::-1].ravel(), np.arange(num_hexagons)))
+
+    # The hexagons visit their neighbors in the order they first appear in the edges,
+    # followed by the hexagons without any neighbor
+    first_visit = num_visits + np.arange(num_hexagons)
+    np.minimum.at(first_visit, edges.ravel(), np.arange(num_visits))
+    order = np.lexsort((np.arange(len(visitor)), first_visit[visitor]))
+    visitor, visited = visitor[order], visited[order]
+
+    # Keep every pair of a hexagon and its neighbor only the first time it is reached,
+    # each pair is reached from both of its hexagons but only needs to be evaluated once
+    pair_ids = np.minimum(visitor, visited) * num_hexagons + np.maximum(visitor, visited)
+    first_reached = np.sort(np.unique(pair_ids, return_index=True)[1])
+    visitor, visited = visitor[first_reached], visited[first_reached]
+
+    # Gather and round the average distances of all pairs at once, only the blocks of neighboring hexagons are divided
+    if len(visitor):
+        positions = np.array([hex_index[hexagon] for hexagon in hexagons])
+        first, second = positions[visitor], positions[visited]
+        distances = np.round(block_sums[first, second] / (sizes[first] * sizes[second]), 5)
+        pairs = [frozenset([hexagons[i], hexagons[j]]) for i, j in zip(visitor.tolist(), visited.tolist())]
+        averages.update(zip(pairs, distances.tolist()))
+
+    return averages
 
-    # Add hexagons not yet in the neighbors dictionary with an empty list
-    for hexagon in hexagons:
-        if hexagon not in neighbors:
-            neighbors[hexagon] = []
 
-    # Calculate the average distance between the hexagon and its neighbors
-    for hexagon, neighbor_list in neighbors.items():
-        # append the hexagon to the neighbor list to calculate the distance with itself
-        neighbor_list.append(hexagon)
-        for neighbor in neighbor_list:
-            ids_in_hexagon = samples_in_hex.get(hexagon, [])
-            ids_in_neighbor = samples_in_hex.get(neighbor, [])
-            # Get the pair of hexagons
-            pair = frozenset([hexagon, neighbor])
+def add_age_group_tuple(df):
+    """
+    Adds the 'AgeGroupTuple' column with the start and end years of the age group of each sample, if it is missing.
+    The start and end years are also added as the integer columns 'AgeStart' and 'AgeEnd', which are faster to group and filter on.
 
-            # Calculate the average distance between the hexagon and its neighbor
-            distance = calc_avg_dist(ids_in_hexagon, ids_in_neighbor, dist_matrix)
+    Each distinct 'AgeGroup' string is parsed only once.
 
-            averages[pair] = round(distance, 5)
+    Parameters:
+    - df (pd.DataFrame): DataFrame containing an 'AgeGroup' column with time bins as strings.
 
-    return averages
+    Returns:
+    - df (pd.DataFrame): DataFrame with the 'AgeGroupTuple', 'AgeStart' and 'AgeEnd' columns.
+    """
+    if 'AgeGroupTuple' not in df.columns:
+        # Convert 'AgeGroup' column values to tuples of integers representing the start and end years
+        parsed = {group: tuple(map(int, group.split('-'))) for group in df['AgeGroup'].unique()}
+        df['AgeGroupTuple'] = df['AgeGroup'].map(parsed)
+        df['AgeStart'] = df['AgeGroup'].map({group: start for group, (start, _) in parsed.items()})
+        df['AgeEnd'] = df['AgeGroup'].map({group: end for group, (_, end) in parsed.items()})
+    return df
 
 
-def calc_dist_time_bin(df, dist_matrix=None):
+def calc_dist_time_bin(df, dist_matrix=None, id_to_rows=None, max_workers=2):
     """
     Calculate the average distance between each hexagon and its neighbors for each time bin.
 
     Parameters:
     - df (pd.DataFrame): DataFrame containing the data with hexagon IDs and age groups.
-    - dist_matrix (pd.DataFrame): A DataFrame representing the distance matrix. Default is None.
+    - dist_matrix (np.ndarray): The distance matrix as a NumPy array. Default is None.
+    - id_to_rows (dict): Dictionary mapping every sample ID to an array of its rows in the distance matrix. Default is None.
+    - max_workers (int): Number of time bins calculated at the same time, each holds its own submatrix in memory. Default is 2.
 
     Returns:
     - dict: A dictionary where keys are time bin labels and values are dictionaries of average distances 
@@ -149,38 +244,50 @@ def calc_dist_time_bin(df, dist_matrix=None):
     # Get the column name for hexagons (it should be the only column with 'hex' in the name)
     hex_col = df.columns[df.columns.str.contains('hex')][0]
     
-    # Convert 'AgeGroup' column values to tuples of integers representing the start and end years
-    df['AgeGroupTuple'] = df['AgeGroup'].apply(lambda x: tuple(map(int, x.split('-'))))
-    
-    # Sort the unique age group tuples to process them in chronological order
-    time_bins = sorted(df['AgeGroupTuple'].unique())
+    # Add the start and end years of each age group
+    df = add_age_group_tuple(df)
     averages = {}
     number_of_samples = {}
 
-    # Iterate over each time bin
-    for time_bin in time_bins:
-        # Format the current time bin as a string for labeling purposes
-        bin_label = rename_times(time_bin)
-        
-        # Get subset of the DataFrame for the current time bin
-        time_bin_df = df[df['AgeGroupTuple'] == time_bin]
-        
-        # Get the number of samples in each hexagon
-        samples_in_hex = time_bin_df.groupby(hex_col)['ID'].apply(list).to_dict()
-        samples_in_hex = {hex: len(samples) for hex, samples in samples_in_hex.items()}
-        
-        # Append the number of samples in each hexagon to the dictionary using the time bin label as the key
-        number_of_samples[bin_label] = samples_in_hex
+    # Get the positions of the samples of every hexagon in every time bin in a single pass over the DataFrame
+    positions_in_bin_hex = df.groupby(['AgeStart', 'AgeEnd', hex_col], sort=True).indices
+    ids = df['ID'].to_numpy()
 
-        # Get all unique hexagons for the current time bin
-        hexagons = time_bin_df[hex_col].unique()
-        
-        # Calculate the average distance for each hexagon to its neighbors within the current time bin
-        average_distances = calc_neighbor_dist(hexagons, dist_matrix, time_bin_df, hex_col)
+    # Collect the rows of the distance matrix for the samples of each hexagon, per time bin
+    rows_in_bin = defaultdict(dict)
+    for (start, end, hexagon), positions in positions_in_bin_hex.items():
+        rows_in_bin[(start, end)][hexagon] = (positions, get_sample_rows(id_to_rows, ids[positions]))
 
-        # Append the calculated average distances to the dictionary using the time bin label as the key
-        averages[bin_label] = average_distances
-        
+    # Format all time bins as strings for labeling purposes at once
+    bin_labels = rename_times_list(list(rows_in_bin))
+
+    def calc_time_bin(hex_rows):
+        """
+        Calculate the average distances between neighboring hexagons of a single time bin.
+
+        Parameters:
+        - hex_rows (dict): The positions of the samples in df and their rows of the distance matrix for each hexagon.
+
+        Returns:
+        - dict: A dictionary where keys are pairs of hexagons (as frozensets) and values are the average distances between them.
+        """
+        # Get all unique hexagons for the time bin, in order of their first sample
+        hexagons = sorted(hex_rows, key=lambda hex: hex_rows[hex][0][0])
+        rows_in_hex = {hex: rows for hex, (_, rows) in hex_rows.items()}
+        return calc_neighbor_dist(hexagons, dist_matrix, rows_in_hex)
+
+    # The time bins are independent of each other, so a few of them are calculated in parallel threads,
+    # the number of threads is kept small, since every running time bin holds its own submatrix in memory
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(calc_time_bin, rows_in_bin.values())
+
+        # Collect the results of each time bin in chronological order
+        for bin_label, hex_rows, average_distances in zip(bin_labels, rows_in_bin.values(), results):
+            # Append the number of samples in each hexagon to the dictionary using the time bin label as the key
+            number_of_samples[bin_label] = {hex: len(positions) for hex, (positions, _) in hex_rows.items()}
+
+            # Append the calculated average distances to the dictionary using the time bin label as the key
+            averages[bin_label] = average_distances
 
     # Return the dictionary with the average distances between neighboring hexagons for each time bin
     return averages, number_of_samples
@@ -198,13 +305,120 @@ def get_hexagons(time_bin):
             - new_time_bin (dict): Dictionary with pairs of samples as keys.
             - hexagons (dict): Dictionary with single samples as keys.
     """
-    # Separate entries with single samples from those with pairs of samples
-    hexagons = {list(pair)[0]: distance for pair, distance in time_bin.items() if len(pair) == 1}
-    new_time_bin = {pair: distance for pair, distance in time_bin.items() if len(pair) > 1}
+    # Separate entries with single samples from those with pairs of samples in one pass
+    hexagons = {}
+    new_time_bin = {}
+    for pair, distance in time_bin.items():
+        if len(pair) == 1:
+            hexagon, = pair
+            hexagons[hexagon] = distance
+        else:
+            new_time_bin[pair] = distance
     
     return new_time_bin, hexagons
 
 
+@lru_cache(maxsize=100_000)
+def get_hex_center(hexagon):
+    """
+    Gets the center of a hexagon, cached since hexagons recur across time bins.
+
+    Args:
+        hexagon (str): The H3 index of the hexagon.
+
+    Returns:
+        tuple: The latitude and longitude of the center of the hexagon.
+    """
+    return h3.cell_to_latlng(hexagon)
+
+
+@lru_cache(maxsize=100_000)
+def get_hex_boundary(hexagon):
+    """
+    Gets the corners of a hexagon, cached since a hexagon borders many of its neighbors.
+
+    Args:
+        hexagon (str): The H3 index of the hexagon.
+
+    Returns:
+        tuple: The latitude and longitude of each corner of the hexagon.
+    """
+    return h3.cell_to_boundary(hexagon)
+
+
+@lru_cache(maxsize=100_000)
+def get_grid_disk(hexagon, k):
+    """
+    Gets all hexagons within k steps of a hexagon, cached since the result never changes.
+
+    Args:
+        hexagon (str): The H3 index of the hexagon.
+        k (int): The number of steps.
+
+    Returns:
+        tuple: The H3 indices of the hexagons within k steps, including the hexagon itself.
+    """
+    return tuple(h3.grid_disk(hexagon, k))
+
+
+@lru_cache(maxsize=100_000)
+def find_h3_line(hex_start, hex_end, max_iterations=10):
+    """
+    Finds an H3 line between two hexagons, potentially using midpoints if necessary.
+
+    Cached since the same pairs of hexagons recur across time bins and threshold changes.
+
+    Args:
+        hex_start (str): The H3 index of the first hexagon.
+        hex_end (str): The H3 index of the second hexagon.
+        max_iterations (int, optional): The maximum depth of midpoints to try. Default is 10.
+
+    Returns:
+        tuple: The H3 indices of the hexagons on the line, or None if no line was found.
+    """
+    try:
+        # Try to create a direct line first
+        return tuple(h3.grid_path_cells(hex_start, hex_end))
+    except h3.H3BaseException:
+        if max_iterations <= 0:
+            return None  # Failed to find a line after maximum iterations
+        
+        # Calculate the midpoint between the centers of the two hexagons
+        center_start = get_hex_center(hex_start)
+        center_end = get_hex_center(hex_end)
+        midpoint = [(center_start[0] + center_end[0]) / 2, (center_start[1] + center_end[1]) / 2]
+        
+        # Convert midpoint to the nearest H3 hexagon
+        midpoint_hex = h3.latlng_to_cell(midpoint[0], midpoint[1], h3.get_resolution(hex_start))
+        
+        # Recursively attempt to find lines using the midpoint
+        first_half = find_h3_line(hex_start, midpoint_hex, max_iterations - 1)
+        second_half = find_h3_line(midpoint_hex, hex_end, max_iterations - 1)
+        
+        if first_half is not None and second_half is not None:
+            # Combine the two halves, removing the duplicate midpoint hex
+            return first_half[:-1] + second_half
+        else:
+            return None
+
+
+def get_grid_distance(hex_start, hex_end):
+    """
+    Gets the number of steps between two hexagons.
+
+    Args:
+        hex_start (str): The H3 index of the first hexagon.
+        hex_end (str): The H3 index of the second hexagon.
+
+    Returns:
+        int: The number of steps between the hexagons, or None if H3 can not compute it.
+    """
+    try:
+        return h3.grid_distance(hex_start, hex_end)
+    except h3.H3BaseException:
+        return None
+
+
 def get_isolated_hex_and_barriers(time_bin, hexagons, threshold, allowed_distance=12):
     """
     Identify isolated hexagons and barriers for each time bin.
@@ -223,79 +437,72 @@ def get_isolated_hex_and_barriers(time_bin, hexagons, threshold, allowed_distanc
         - new_time_bin (dict): new Dictionary of pairs of hexagons with their distances only containing the ones that are within the allowed distance
     """
     
-    def find_h3_line(hex_start, hex_end, max_iterations=10):
-        """Finds an H3 line between two hexagons, potentially using midpoints if necessary."""
-        try:
-            # Try to create a direct line first
-            return h3.grid_path_cells(hex_start, hex_end)
-        except:
-            if max_iterations <= 0:
-                return None  # Failed to find a line after maximum iterations
-            
-            # Calculate the midpoint between the centers of the two hexagons
-            center_start = h3.cell_to_latlng(hex_start)
-            center_end = h3.cell_to_latlng(hex_end)
-            midpoint = [(center_start[0] + center_end[0]) / 2, (center_start[1] + center_end[1]) / 2]
-            
-            # Convert midpoint to the nearest H3 hexagon
-            midpoint_hex = h3.latlng_to_cell(midpoint[0], midpoint[1], h3.get_resolution(hex_start))
-            
-            # Recursively attempt to find lines using the midpoint
-            first_half = find_h3_line(hex_start, midpoint_hex, max_iterations - 1)
-            second_half = find_h3_line(midpoint_hex, hex_end, max_iterations - 1)
-            
-            if first_half is not None and second_half is not None:
-                # Combine the two halves, removing the duplicate midpoint hex
-                return first_half[:-1] + second_half
-            else:
-                return None
-
     # Dictionaries to save barrier lines, hexagons with distances, and direct neighbor distances
     barrier_lines = defaultdict(float)
-    barrier_hex = defaultdict(list)
-    hex_dist_to_direct_neighbors = defaultdict(list)
+    line_hexagons = []
+    line_distances = []
+    neighbor_hexagons = []
+    neighbor_distances = []
     new_time_bin = defaultdict(float)
     
     # Loop over all pairs of hexagons in the time bin
     for pair, distance in time_bin.items():
         pair = list(pair)
         # Check if the pair are direct neighbors
-        if pair[0] in h3.grid_ring(pair[1], 1)[1]:
+        if h3.are_neighbor_cells(pair[0], pair[1]):
             # Get the line between the two hexagons
-            boundary1 = h3.cell_to_boundary(pair[0])
-            boundary2 = h3.cell_to_boundary(pair[1])
+            boundary1 = get_hex_boundary(pair[0])
+            boundary2 = get_hex_boundary(pair[1])
             # Get the pair of dots that the two hexagons share
-            shared_boundary = frozenset([x for x in boundary1 if x in boundary2])
+            shared_boundary = frozenset(boundary1).intersection(boundary2)
             # Add the line and its distance to the dictionary
             barrier_lines[shared_boundary] = distance
-            hex_dist_to_direct_neighbors[pair[0]].append(distance)
-            hex_dist_to_direct_neighbors[pair[1]].append(distance)
+            neighbor_hexagons.extend(pair)
+            neighbor_distances.extend([distance, distance])
             # add the pair and the distance to the new time bin
             new_time_bin[frozenset(pair)] = distance
         else:
+            # A line between the two hexagons has at least one hexagon more than their grid distance,
+            # so skip the pairs that are too far apart without searching for the line
+            grid_distance = get_grid_distance(pair[0], pair[1])
+            if grid_distance is not None and grid_distance >= allowed_distance:
+                continue
             # Get the line between the two hexagons using the find_h3_line function
             line = find_h3_line(pair[0], pair[1])
             if line is not None and len(line) <= allowed_distance:
-                for hex in line:
-                    barrier_hex[hex].append(distance)
+                # Collect the hexagons of the line with the distance of the pair
+                line_hexagons.extend(line)
+                line_distances.extend([distance] * len(line))
                 # add the pair and the distance to the new time bin
                 new_time_bin[frozenset(pair)] = distance
 
-    # Calculate the average distance for each hexagon and round it to 2 decimal places
-    barrier_hex = {hex: round(sum(distances) / len(distances), 2) for hex, distances in barrier_hex.items()}
+    # Calculate the average distance for each hexagon on the lines at once and round it to 2 decimal places
+    barrier_hex = {}
+    if line_hexagons:
+        hex_ids, unique_hexagons = pd.factorize(np.array(line_hexagons, dtype=object))
+        sums = np.bincount(hex_ids, weights=line_distances)
+        counts = np.bincount(hex_ids)
+        barrier_hex = {hex: round(average, 2) for hex, average in zip(unique_hexagons, (sums / counts).tolist())}
     
-    # Get all distances for every hexagon that are not yet in the hex_dist_to_direct_neighbors to check for isolated hexagons
+    # Add all distances of every hexagon in the time bin to check for isolated hexagons
     for pair, distance in time_bin.items():
         for hex in pair:
-            hex_dist_to_direct_neighbors[hex].append(distance)
-    
-    # extract the hexagons that are isolated given the threshold
-    isolated_hex = [hex for hex, distances in hex_dist_to_direct_neighbors.items() if all(d >= threshold for d in distances)]
+            neighbor_hexagons.append(hex)
+            neighbor_distances.append(distance)
+    
+    # extract the hexagons that are isolated given the threshold, i.e. whose smallest distance is not below it,
+    # the minimum of every hexagon is taken in one scan over all distances (a NaN distance is never isolated)
+    isolated_hex = []
+    if neighbor_hexagons:
+        hex_ids, unique_hexagons = pd.factorize(np.array(neighbor_hexagons, dtype=object))
+        min_distances = np.full(len(unique_hexagons), np.inf)
+        np.minimum.at(min_distances, hex_ids, np.array(neighbor_distances, dtype=float))
+        isolated_hex = list(compress(unique_hexagons, min_distances >= threshold))
     
     return isolated_hex, barrier_lines, barrier_hex, new_time_bin
 
 
-def find_closest_population(df, time_bin_index, isolated_hex, dist_matrix, threshold, gen_distances_pred, resolution):
+def find_closest_population(df, time_bin_index, isolated_hex, dist_matrix, id_to_rows, threshold, gen_distances_pred, resolution):
     """
     Find the closest population for each isolated hexagon.
 
@@ -303,7 +510,8 @@ def find_closest_population(df, time_bin_index, isolated_hex, dist_matrix, thres
     - df (pd.DataFrame): DataFrame containing the data with hexagon IDs and age groups.
     - time_bin_index (int): Index of the time bin to be analyzed.
     - isolated_hex (list): List of isolated hexagons.
-    - dist_matrix (pd.DataFrame): A DataFrame representing the distance matrix.
+    - dist_matrix (np.ndarray): The distance matrix as a NumPy array.
+    - id_to_rows (dict): Dictionary mapping every sample ID to an array of its rows in the distance matrix.
     - threshold (float): Distance threshold to consider a hexagon isolated.
     - gen_distance_pred (np.array): Array of predicted genetic distances based on geographic distances.
 
@@ -313,14 +521,15 @@ def find_closest_population(df, time_bin_index, isolated_hex, dist_matrix, thres
         - new_isolated_hex (list): List of isolated hexagons that have no close population.
     """
 
-    # Convert 'AgeGroup' column values to tuples of integers representing the start and end years
-    df['AgeGroupTuple'] = df['AgeGroup'].apply(lambda x: tuple(map(int, x.split('-'))))
+    # Add the start and end years of each age group
+    df = add_age_group_tuple(df)
     
-    # Sort the unique age group tuples to process them in chronological order
-    time_bins = sorted(df['AgeGroupTuple'].unique())
+    # Sort the unique start and end years to process the time bins in chronological order
+    time_bins = df[['AgeStart', 'AgeEnd']].drop_duplicates().sort_values(['AgeStart', 'AgeEnd'])
+    start, end = time_bins.iloc[time_bin_index]
     
     # Get the samples in the time bin of interest
-    time_bin_df = df[df['AgeGroupTuple'] == time_bins[time_bin_index]]
+    time_bin_df = df[(df['AgeStart'] == start) & (df['AgeEnd'] == end)]
     
     # Get column name for hexagons (it should be the only column with 'hex' in the name)
     hex_col = time_bin_df.filter(like='hex').columns[0]
@@ -328,12 +537,15 @@ def find_closest_population(df, time_bin_index, isolated_hex, dist_matrix, thres
     # Get all unique hexagons from the DataFrame
     hexagons = time_bin_df[hex_col].unique()
     
-    # Get the samples in each hexagon
-    samples_in_hex = time_bin_df.groupby(hex_col)['ID'].apply(list).to_dict()
+    # Get the rows of the distance matrix for the samples in each hexagon
+    rows_in_hex = get_rows_in_hex(time_bin_df, hex_col, id_to_rows)
     
-    # Create a submatrix of the distance matrix for the samples in the hexagons
-    all_samples = [sample for samples in samples_in_hex.values() for sample in samples]
-    dist_matrix = dist_matrix.loc[all_samples, all_samples]
+    # Get the columns of the distance matrix for the samples in the time bin once,
+    # the samples of each hexagon are a contiguous block of these columns in the order of hexagons
+    all_rows = np.concatenate([rows_in_hex[hex] for hex in hexagons])
+    hex_index = {hex: i for i, hex in enumerate(hexagons)}
+    sizes = np.array([len(rows_in_hex[hex]) for hex in hexagons])
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
     
     # Prepare dictionary to hold the distances between the hexagons
     closest_populations = {}
@@ -343,26 +555,26 @@ def find_closest_population(df, time_bin_index, isolated_hex, dist_matrix, thres
     
     # Loop over all isolated hexagons
     for iso in isolated_hex:
-        # Initialize the minimum distance to the threshold
-        min_dist = float('inf')
-        all_dist = {}
-        closest_hex = None
+        # An isolated hexagon without any other hexagon in the time bin has no close population
+        if len(hexagons) < 2:
+            new_isolated_hex.append(iso)
+            continue
+        
+        # get the average distances to every hexagon in the time bin at once by summing the blocks of columns of its rows,
+        # only the rows of the isolated hexagon are read from the distance matrix
+        i = hex_index[iso]
+        rows_in_iso = dist_matrix[np.ix_(rows_in_hex[iso], all_rows)]
+        distances = np.add.reduceat(rows_in_iso, starts, axis=1, dtype=np.float64).sum(axis=0) / (sizes[i] * sizes)
+        # the distance to itself is not considered
+        distances[i] = np.inf
+        
+        # Get the closest hexagon, the first one on ties
+        closest = int(np.argmin(distances))
+        closest_hex = hexagons[closest]
+        min_dist = float(distances[closest])
         
-        # get distances to every hexagon in the time bin
-        Ids_in_iso = samples_in_hex.get(iso, [])
-        for hex in hexagons:
-            if hex == iso:
-                continue
-
-            Ids_in_neighbor = samples_in_hex.get(hex, [])
-            distance = calc_avg_dist(Ids_in_iso, Ids_in_neighbor, dist_matrix)
-            
-            if distance < min_dist:
-                min_dist = distance
-                closest_hex = hex
-            
         # add the distance to the dictionary with the two hexagons as a pair
-        all_dist[frozenset([iso, closest_hex])] = round(distance, 2)
+        all_dist = {frozenset([iso, closest_hex]): round(min_dist, 2)}
         
         # scale the distances by the estimated genetic differences
         scaled_distances = scale_distances(all_dist, gen_distances_pred, resolution)[0]
@@ -380,6 +592,9 @@ def impute_missing_hexagons(barrier_hex, num_runs=5):
     """
     Impute missing hexagons by iteratively adding neighboring hexagons that meet criteria.
 
+    In each run a hexagon is imputed with the average of its known neighbors if it has at least 3 of them.
+    Known hexagons never change, so only the neighbors of the hexagons imputed in the previous run need to be checked.
+
     Parameters:
     - barrier_hex (dict): Dictionary with hexagon IDs as keys and average distances as values.
     - num_runs (int): Number of iterations to perform the imputation.
@@ -387,39 +602,63 @@ def impute_missing_hexagons(barrier_hex, num_runs=5):
     Returns:
     - imputed_hex (dict): Dictionary with newly imputed hexagons and their average distances.
     """
-    def impute(barrier_hex):
-        """
-        Impute missing hexagons for a single run based on neighbors.
-
-        Parameters:
-        - barrier_hex (dict): Dictionary with hexagon IDs as keys and average distances as values.
-
-        Returns:
-        - output_hex (dict): Dictionary of newly imputed hexagons with calculated average distances.
-        """
-        # Convert barrier_hex keys to a set for faster lookup
-        barrier_hex_set = set(barrier_hex)
-        new_barrier_hex = defaultdict(list)
-
-        # Iterate through all barrier hexagons
-        for hexagon in barrier_hex:
-            # Find neighbors that are not in the barrier_hex
-            neighbors = [hex for hex in h3.grid_disk(hexagon, 1) if hex not in barrier_hex_set]
-            # Collect distances for these neighbors
-            for neighbor in neighbors:
-                new_barrier_hex[neighbor].append(barrier_hex[hexagon])
-
-        # Calculate average distance for neighbors with at least 3 entries
-        output_hex = {hexagon: round(sum(distances) / len(distances), 2)
-                        for hexagon, distances in new_barrier_hex.items() if len(distances) >= 3}
-        return output_hex
-
     # Create a copy of the barrier_hex
     imputed_hex = barrier_hex.copy()
+    # The hexagons whose neighbors can be imputed in the next run
+    frontier = barrier_hex
+    # The insertion position of every known hexagon, the distances are summed in this order
+    position = {hex: i for i, hex in enumerate(imputed_hex)}
+    known_hexagons = list(imputed_hex)
 
     # Perform imputation for the specified number of runs
     for _ in range(num_runs):
-        imputed_hex.update(impute(imputed_hex))
+        # Find neighbors of the frontier that are not known yet
+        candidates = list(dict.fromkeys(neighbor for hexagon in frontier for neighbor in get_grid_disk(hexagon, 1) if neighbor not in imputed_hex))
+
+        # Collect the known neighbors of every candidate with their position and distance
+        candidate_ids, known_positions = [], []
+        for i, candidate in enumerate(candidates):
+            for hex in get_grid_disk(candidate, 1):
+                if hex in position:
+                    candidate_ids.append(i)
+                    known_positions.append(position[hex])
+        if not candidate_ids:
+            break
+
+        # Sort the known neighbors of each candidate in the order they were added,
+        # then sum and count them for all candidates at once
+        candidate_ids = np.array(candidate_ids)
+        known_positions = np.array(known_positions)
+        sort = np.lexsort((known_positions, candidate_ids))
+        candidate_ids, known_positions = candidate_ids[sort], known_positions[sort]
+        distances = np.array([imputed_hex[known_hexagons[i]] for i in known_positions.tolist()], dtype=float)
+        counts = np.bincount(candidate_ids, minlength=len(candidates))
+        sums = np.zeros(len(candidates))
+        np.add.at(sums, candidate_ids, distances)
+
+        # Calculate average distance for candidates with at least 3 known neighbors
+        selected = np.flatnonzero(counts >= 3)
+
+        # Stop early if nothing new can be imputed
+        if len(selected) == 0:
+            break
+
+        # The first known neighbor of each selected candidate
+        first_known = known_positions[np.searchsorted(candidate_ids, selected)]
+        new_hex = {}
+        order = {}
+        for i, average, first in zip(selected.tolist(), (sums[selected] / counts[selected]).tolist(), first_known.tolist()):
+            candidate = candidates[i]
+            new_hex[candidate] = round(average, 2)
+            # Order by the first known neighbor, as if every known hexagon was expanded in turn
+            order[candidate] = (first, get_grid_disk(known_hexagons[first], 1).index(candidate))
+
+        # Add the new hexagons in a stable order
+        for hexagon in sorted(new_hex, key=order.get):
+            position[hexagon] = len(position)
+            known_hexagons.append(hexagon)
+            imputed_hex[hexagon] = new_hex[hexagon]
+        frontier = new_hex
 
     # Remove hexagons that were originally in the barrier_hex
     imputed_hex = {hex: dist for hex, dist in imputed_hex.items() if hex not in barrier_hex}
@@ -453,16 +692,22 @@ def scale_distances(time_bin, exsiting_pred=None, resolution=3):
         if hex2 is None:
             return 1281/(2.65**resolution)
         # else calculate the distance between the two hexagons based on the haversine formula
-        coord1 = h3.cell_to_latlng(hex1)
-        coord2 = h3.cell_to_latlng(hex2)
+        coord1 = get_hex_center(hex1)
+        coord2 = get_hex_center(hex2)
         return haversine(coord1, coord2)
 
-    # Calculate km distances between the hexagons
-    km_time_bin = {pair: get_km_distance(*pair) for pair in time_bin}
-
-    # Convert genetic and geographic distances to numpy arrays
-    gen_distances = np.array(list(time_bin.values()))
-    geo_distances = np.array(list(km_time_bin.values()))
+    # Calculate km distances between the hexagons, a hexagon paired with itself gets the fixed value
+    pairs = [tuple(pair) for pair in time_bin]
+    geo_distances = np.full(len(pairs), get_km_distance(None))
+    # Calculate the distances of all pairs of two different hexagons at once
+    two_hex = [i for i, pair in enumerate(pairs) if len(pair) == 2]
+    if two_hex:
+        coords1 = [get_hex_center(pairs[i][0]) for i in two_hex]
+        coords2 = [get_hex_center(pairs[i][1]) for i in two_hex]
+        geo_distances[two_hex] = haversine_vector(coords1, coords2)
+
+    # Convert genetic distances to a numpy array in one pass over the values
+    gen_distances = np.fromiter(time_bin.values(), dtype=float, count=len(time_bin))
     # if there is no existing prediction, create one
     if exsiting_pred is None:
         # Apply LOESS smoothing to the genetic distances based on geographic distances
@@ -471,21 +716,21 @@ def scale_distances(time_bin, exsiting_pred=None, resolution=3):
     else:
         gen_distances_pred = exsiting_pred
 
-    # Scale genetic distances by the predicted values from the LOESS model
-    output = {}
-    for pair in time_bin:
-        km_distance = km_time_bin[pair]
-        # if km_distance not in gen_distances_pred[:, 0]: find the one closest to it
-        if km_distance not in gen_distances_pred[:, 0]:
-            km_distance = gen_distances_pred[:, 0][np.argmin(np.abs(gen_distances_pred[:, 0] - km_distance))]
-        gen_distance = time_bin[pair]
-        gen_distance_pred = abs(gen_distances_pred[gen_distances_pred[:, 0] == km_distance][:, 1][0])
-        # check if the predicted distance is 0
-        if gen_distance == 0:
-            output[pair] = 0
-        # else get the log 2 of the ratio of the genetic distance to the predicted genetic distance
-        else:
-            output[pair] = round(math.log2(gen_distance / gen_distance_pred),2)
+    # Find the predicted value at the closest km distance of the prediction for every pair, the first one on ties,
+    # the km distances of the prediction are sorted, so the closest one is found with a binary search
+    pred_distances = gen_distances_pred[:, 0]
+    right = np.minimum(np.searchsorted(pred_distances, geo_distances, side='left'), len(pred_distances) - 1)
+    left = np.searchsorted(pred_distances, pred_distances[np.maximum(right - 1, 0)], side='left')
+    use_left = np.abs(pred_distances[left] - geo_distances) <= np.abs(pred_distances[right] - geo_distances)
+    closest = np.where(use_left, left, right)
+    predicted = np.abs(gen_distances_pred[closest, 1])
+
+    # Scale genetic distances by the predicted values from the LOESS model, the log 2 of the ratio 
+    # of the genetic distance to the predicted genetic distance, or 0 if the genetic distance is 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scaled = np.round(np.log2(gen_distances / predicted), 2).astype(object)
+    scaled[gen_distances == 0] = 0
+    output = dict(zip(time_bin, scaled.tolist()))
 
     return output, gen_distances_pred
 
@@ -502,8 +747,8 @@ def get_distance_lines(time_bin):
     lines = {}
     for key, value in time_bin.items():
         hex1, hex2 = key
-        coord1 = h3.cell_to_latlng(hex1)
-        coord2 = h3.cell_to_latlng(hex2)
+        coord1 = get_hex_center(hex1)
+        coord2 = get_hex_center(hex2)
         # Create a frozenset of coordinates to represent the line
         shared_boundary = frozenset([coord1, coord2])
         lines[shared_boundary] = value
@@ -520,43 +765,18 @@ def rename_time_bins(df):
     Returns:
     - renamed_bins (list): List of renamed time bins in a more readable format.
     """
-    # Convert the 'AgeGroup' column values to tuples of integers representing the start and end years
-    df['AgeGroupTuple'] = df['AgeGroup'].apply(lambda x: tuple(map(int, x.split('-'))))
+    # Add the start and end years of each age group
+    df = add_age_group_tuple(df)
     
-    # Sort the unique age group tuples to process them in chronological order
-    time_bins = sorted(df['AgeGroupTuple'].unique())
+    # Sort the unique age groups to process them in chronological order, the integer start and end columns
+    # are deduplicated and sorted directly instead of the column of tuples
+    time_bins = list(df[['AgeStart', 'AgeEnd']].drop_duplicates().sort_values(['AgeStart', 'AgeEnd']).itertuples(index=False, name=None))
     
-    # Rename the time bins using the rename_times function
+    # Rename the time bins using the rename_times_list function
     renamed_bins, name_dict = rename_times_list(time_bins, return_mapping=True)
     
     return renamed_bins, name_dict
 
-def rename_times(time_bin):
-    """
-    Renames a time bin into a more readable format, converting years to BC/AD notation.
-
-    Parameters:
-    - time_bin (tuple): A tuple of integers representing the start and end years.
-
-    Returns:
-    - str: A string representing the time bin in a more readable BC/AD format.
-    """
-    renamed_years = []
-    for year in time_bin:
-        if year < 1950:
-            year = 1950 - year
-            year_str = f"{year} AD"
-        else:
-            year = year - 1950
-            year_str = f"{year} BC"
-        renamed_years.append(year_str)
-        
-    # flip the order of the renamed years
-    renamed_years.reverse()
-    
-    return " - ".join(renamed_years)
-
-
 def rename_times_list(time_bins, return_mapping=False):
     """
     Renames time bins into more readable BC/AD format, converting years relative to 1950.
@@ -569,26 +789,20 @@ def rename_times_list(time_bins, return_mapping=False):
     - list: List of renamed time bin strings.
     - dict (optional): Dictionary mapping renamed strings to original tuples.
     """
-    renamed_bins = []
-    mapping = {}
-
-    for time_bin in time_bins:
-        renamed_years = []
-        for year in time_bin:
-            if year < 1950:
-                year_str = f"{1950 - year} AD"
-            else:
-                year_str = f"{year - 1950} BC"
-            renamed_years.append(year_str)
+    time_bins = list(time_bins)
+    years = np.array(time_bins, dtype=int).reshape(-1, 2)
 
-        renamed_years.reverse()
-        renamed_str = " - ".join(renamed_years)
-        renamed_bins.append(renamed_str)
+    # Convert all years to BC/AD notation at once
+    renamed_years = np.where(years < 1950,
+                             np.char.add((1950 - years).astype(str), " AD"),
+                             np.char.add((years - 1950).astype(str), " BC"))
+    # Join the years in reversed order
+    renamed_bins = np.char.add(np.char.add(renamed_years[:, 1], " - "), renamed_years[:, 0]).tolist()
 
-        if return_mapping:
-            mapping[renamed_str] = time_bin
-
-    return (renamed_bins, mapping) if return_mapping else renamed_bins
+    if return_mapping:
+        mapping = dict(zip(renamed_bins, time_bins))
+        return renamed_bins, mapping
+    return renamed_bins
 
 
 def create_equal_age_groups(df, number_of_bins):
@@ -613,12 +827,15 @@ def create_equal_age_groups(df, number_of_bins):
     low_b = min_age
     up_b = min_age + bin_size
 
+    # Count the samples in a range of ages with a binary search on the sorted ages instead of masking the DataFrame
+    ages = df['Age'].to_numpy()
+    sorted_ages = np.sort(ages)
+
     for _ in range(number_of_bins - 1):
-        temp_df = df[(df['Age'] >= low_b) & (df['Age'] < up_b)]
-        while temp_df.shape[0] < 5:
+        first = np.searchsorted(sorted_ages, low_b, side='left')
+        while np.searchsorted(sorted_ages, up_b, side='left') - first < 5:
             up_b += 500
-            temp_df = df[(df['Age'] >= low_b) & (df['Age'] < up_b)]
-        age_groups.append(temp_df)
+        age_groups.append(df[(ages >= low_b) & (ages < up_b)])
         low_b = up_b
         up_b += bin_size
 
@@ -669,9 +886,8 @@ def name_age_groups(age_groups):
     for group in age_groups:
         min_age = group['Age'].min()
         max_age = group['Age'].max()
-        for i in range(len(group)):
-            id = group.iloc[i]['ID']
-            name_dict[id] = f"{min_age}-{max_age}"
+        # Assign the name to all sample IDs of the group at once
+        name_dict.update(dict.fromkeys(group['ID'], f"{min_age}-{max_age}"))
     return name_dict
 
 
@@ -700,8 +916,7 @@ def filter_df(df):
     Returns:
     - filtered_df (pd.DataFrame): Filtered DataFrame.
     """
-    filtered_df = df[df['Latitude'] != '..']
-    filtered_df = filtered_df[filtered_df['Longitude'] != '..']
+    filtered_df = df[(df['Latitude'] != '..') & (df['Longitude'] != '..')]
     return filtered_df
 
 
@@ -717,9 +932,15 @@ def assign_hexagon_to_samples(df, resolution):
     - df (pd.DataFrame): DataFrame with an added hexagon column.
     """
     hex_col = 'hex_res_' + str(resolution)
-    df[hex_col] = df.apply(lambda x: h3.latlng_to_cell(float(x['Latitude']), float(x['Longitude']), res=resolution), axis=1)
-    df["hex_center_lat"] = df[hex_col].apply(lambda x: h3.cell_to_latlng(x)[0])
-    df["hex_center_lon"] = df[hex_col].apply(lambda x: h3.cell_to_latlng(x)[1])
+    # Convert the coordinates to float arrays once instead of building a row object for every sample
+    latitudes = df['Latitude'].to_numpy(dtype=float)
+    longitudes = df['Longitude'].to_numpy(dtype=float)
+    hexagons = [h3.latlng_to_cell(lat, lon, resolution) for lat, lon in zip(latitudes, longitudes)]
+    df[hex_col] = hexagons
+    # Get the center of every hexagon once for both center columns
+    centers = [get_hex_center(hexagon) for hexagon in hexagons]
+    df["hex_center_lat"] = [center[0] for center in centers]
+    df["hex_center_lon"] = [center[1] for center in centers]
     return df
 
 
@@ -747,14 +968,11 @@ def get_samples_per_time_bin(df):
     Returns:
     - new_df (pd.DataFrame): DataFrame with the number of samples per time bin.
     """
-    # Create a new DataFrame with the number of samples per time bin
-    new_df = df.groupby('AgeGroupTuple')['ID'].count().reset_index()
-    
-    # Rename the columns
-    new_df.columns = ['Time Bin', 'Number of samples']
+    # Count the samples per time bin, grouped on the integer start and end years instead of the tuples
+    counts = df.groupby(['AgeStart', 'AgeEnd'])['ID'].count()
     
-    # bring the AgeGroup column in to a more readable format
-    new_df['Time Bin'] = new_df['Time Bin'].apply(rename_times)
+    # bring the time bins in to a more readable format
+    new_df = pd.DataFrame({'Time Bin': rename_times_list(counts.index), 'Number of samples': counts.to_numpy()})
     
     return new_df
 
@@ -1,6 +1,6 @@
 # This script is responsible for the initial run of the pipeline.
 # It reads the excel file with the samples, filters the data, and writes the samples to a new file.
-# It also calculates the euclidean distance matrix from the plink output and writes it to a pickle file.
+# It also calculates the euclidean distance matrix from the plink output and writes it to a NumPy file.
 # The script is called with the path to the excel file as an argument.
 
 #-------------------------------------------------------------------------------------
@@ -73,7 +73,7 @@ def write_sample_list(df: pd.DataFrame, path: str, columns: list):
 
 def create_dist_matrix(df: pd.DataFrame, columns: list, index: int):
     """
-    Calculates the Euclidean distance matrix from the samples and writes it to a pickle file.
+    Calculates the Euclidean distance matrix from the samples and writes it to a NumPy file.
 
     Parameters:
     - df (pd.DataFrame): The input DataFrame containing 'Genetic ID', 'Lat.', 'Long.', and admixture columns.
@@ -109,16 +109,18 @@ def create_dist_matrix(df: pd.DataFrame, columns: list, index: int):
     long = np.array(long)
     admix = np.array(admix)
     
-    # Calculate the Euclidean distance matrix
-    dist = pdist(admix, metric='euclidean')
+    # Calculate the Euclidean distance matrix, the condensed distances are cast to float32 before
+    # they are expanded to the square matrix, so the full matrix is never held in float64
+    # float32 halves the file size and is precise enough for the distances
+    dist = pdist(admix, metric='euclidean').astype(np.float32)
     dist_matrix = squareform(dist)
-    dist_df = pd.DataFrame(dist_matrix, index=names, columns=names)
     
     # Create output directory if it doesn't exist
     os.makedirs("1_dist_matrix", exist_ok=True)
     
-    # Save the distance matrix to a pickle file
-    dist_df.to_pickle("1_dist_matrix/eucl_dist.pkl")
+    # Save the distance matrix and the sample IDs to NumPy files so the app can memory-map the matrix
+    np.save("1_dist_matrix/eucl_dist.npy", dist_matrix)
+    np.save("1_dist_matrix/eucl_dist_ids.npy", names.astype(str))
 
 
 def main():
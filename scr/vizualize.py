@@ -1,13 +1,17 @@
 import h3
 import folium
-from folium import Map, Element
 from branca.element import Template, MacroElement
 import matplotlib.colors as mcolors
-import base64
+import numpy as np
+from itertools import compress
+import pandas as pd
+import pydeck as pdk
+from functools import lru_cache
 from folium.plugins import AntPath
-import matplotlib.colors as mcolors
+from func import get_hex_center
 
 
+@lru_cache(maxsize=100_000)
 def split_hexagon_if_needed(hexagon):
     """
     Splits a hexagon if it crosses the antimeridian.
@@ -15,15 +19,16 @@ def split_hexagon_if_needed(hexagon):
     A hexagon crosses the antimeridian if the difference between its maximum 
     and minimum longitudes is greater than 180 degrees. This function checks 
     for such a condition and splits the hexagon into two parts if necessary.
+    The result is cached, since the boundary of a hexagon never changes.
 
     Parameters:
         hexagon (str): The H3 index of the hexagon to be checked and potentially split.
 
     Returns:
-        list: A list containing one or two tuples of coordinates. If the hexagon 
-              does not cross the antimeridian, the list contains one tuple of 
-              coordinates. If it does cross the antimeridian, the list contains 
-              two tuples of coordinates representing the split hexagon.
+        tuple: A tuple containing one or two tuples of coordinates. If the hexagon 
+               does not cross the antimeridian, the tuple contains one tuple of 
+               coordinates. If it does cross the antimeridian, the tuple contains 
+               two tuples of coordinates representing the split hexagon.
     """
     # Get the boundary as a list of latitude-longitude pairs
     boundary = h3.cell_to_boundary(hexagon)
@@ -43,15 +48,116 @@ def split_hexagon_if_needed(hexagon):
                 first_hex.append((lat, lon))
                 second_hex.append((lat, lon - 360))  # Adjust longitude for continuity
 
-        return [tuple(first_hex), tuple(second_hex)]
+        return (tuple(first_hex), tuple(second_hex))
     else:
-        return [tuple(boundary)]
+        return (tuple(boundary),)
+
+
+@lru_cache(maxsize=100_000)
+def get_hexagon_geometry(hexagon):
+    """
+    Creates a GeoJSON geometry for a hexagon, split into two parts if it crosses the antimeridian.
+
+    The result is cached and shared between features, so it must not be modified.
+
+    Parameters:
+        hexagon (str): The H3 index of the hexagon.
+
+    Returns:
+        dict: A GeoJSON MultiPolygon geometry.
+    """
+    polygons = []
+    for part in split_hexagon_if_needed(hexagon):
+        # GeoJSON expects closed rings of longitude-latitude pairs,
+        # rounded to 5 decimals (about 1 m) to keep the map HTML small
+        ring = [[round(lon, 5), round(lat, 5)] for lat, lon in part]
+        ring.append(ring[0])
+        polygons.append([ring])
+
+    return {"type": "MultiPolygon", "coordinates": polygons}
 
 
-def draw_sample_hexagons(hex_dict, annotation_df, samples_per_hexagon, m=None, color='grey', zoom_start=1, show_samples_per_hexagon=True):
+@lru_cache(maxsize=100_000)
+def get_hexagon_centers(hexagon):
+    """
+    Calculates the center of each part of a hexagon, cached since it never changes.
+
+    Parameters:
+        hexagon (str): The H3 index of the hexagon.
+
+    Returns:
+        tuple: A tuple of (latitude, longitude) centers, one per part of the hexagon.
+    """
+    centers = []
+    for part in split_hexagon_if_needed(hexagon):
+        # Calculate the center of the polygon
+        latitudes = [point[0] for point in part]
+        longitudes = [point[1] for point in part]
+        centers.append((sum(latitudes) / len(latitudes), sum(longitudes) / len(longitudes)))
+
+    return tuple(centers)
+
+
+def get_hexagon_feature(hexagon, **properties):
+    """
+    Creates a GeoJSON feature for a hexagon, split into two parts if it crosses the antimeridian.
+
+    Parameters:
+        hexagon (str): The H3 index of the hexagon.
+        **properties: Properties to store in the feature, e.g. the tooltip text or the fill color.
+
+    Returns:
+        dict: A GeoJSON feature with a MultiPolygon geometry.
+    """
+    return {
+        "type": "Feature",
+        "geometry": get_hexagon_geometry(hexagon),
+        "properties": properties,
+    }
+
+
+def get_sample_hexagon_features(hex_dict, annotation_df):
+    """
+    Creates the GeoJson features of the hexagons that contain samples, with the internal distance as tooltip
+    and a table of the samples as popup.
+
+    Parameters:
+        hex_dict (dict): A dictionary where keys are hexagon H3 indices and 
+                         values are internal average sample distances.
+        annotation_df (pandas.DataFrame): A DataFrame containing annotations for the hexagons.
+
+    Returns:
+        list: The GeoJson features of the hexagons.
+    """
+    # get the samples of each hexagon from the hexagon column of the DataFrame
+    hex_col = annotation_df.columns[annotation_df.columns.str.contains('hex')][0]
+    samples_by_hexagon = {hexagon: samples for hexagon, samples in annotation_df.groupby(hex_col)}
+
+    features = []
+    for hexagon, sample_distance in hex_dict.items():
+        data_text = None
+        if hexagon in samples_by_hexagon:
+            samples_in_hexagon = samples_by_hexagon[hexagon].iloc[:, :4]  # keep only first 4 columns
+            
+            # Wrap table in a scrollable div
+            table_html = samples_in_hexagon.to_html(classes='table table-striped', index=False, border=0)
+            data_text = f'''
+            <div style="max-height: 200px; overflow-y: auto;">
+                {table_html}
+            </div>
+            '''
+
+        features.append(get_hexagon_feature(hexagon, tooltip=f"Internal scaled genetic distance: {sample_distance}", popup=data_text))
+
+    return features
+
+
+def draw_sample_hexagons(hex_dict, annotation_df, samples_per_hexagon, m=None, color='grey', zoom_start=1, show_samples_per_hexagon=True, features=None):
     """
     Draws hexagons on a map, displaying only the borders for hexagons that contain samples.
 
+    All hexagons are added as one GeoJson layer, so the map holds a single layer instead of one polygon per hexagon.
+
     Parameters:
         hex_dict (dict): A dictionary where keys are hexagon H3 indices and 
                          values are internal average sample distances.
@@ -62,6 +168,8 @@ def draw_sample_hexagons(hex_dict, annotation_df, samples_per_hexagon, m=None, c
                                   If None, a new map is created. Defaults to None.
         color (str, optional): The color of the hexagon borders. Defaults to 'grey'.
         zoom_start (int, optional): The initial zoom level of the map. Defaults to 1.
+        features (list, optional): The GeoJson features of the hexagons as returned by get_sample_hexagon_features.
+                                   Created from hex_dict and annotation_df if None. Defaults to None.
 
     Returns:
         folium.Map: The map object with the plotted hexagons.
@@ -69,59 +177,37 @@ def draw_sample_hexagons(hex_dict, annotation_df, samples_per_hexagon, m=None, c
     if m is None:
         m = folium.Map(location=(0.0, 0.0), tiles="Esri worldstreetmap", zoom_start=zoom_start)
 
-    for hexagon, sample_distance in hex_dict.items():
-        parts = split_hexagon_if_needed(hexagon)
-        for part in parts:
-            polygon = folium.Polygon(
-                locations=part,
-                weight=1,
-                color=color,
-                fill_opacity=0.0,
-                fill=True
-            )
-            polygon.add_child(folium.Tooltip(f"Internal scaled genetic distance: {sample_distance}"))
-            polygon.add_to(m)
-            
-            # get the annotation for the hexagon from the last column of the DataFrame
-            last_column = annotation_df.columns[-2]
-            data_text = None
-            if hexagon in annotation_df[last_column].values:
-                samples_in_hexagon = annotation_df[annotation_df[last_column] == hexagon]
-                samples_in_hexagon = samples_in_hexagon.iloc[:, :4]  # keep only first 4 columns
-                
-                # Wrap table in a scrollable div
-                table_html = samples_in_hexagon.to_html(classes='table table-striped', index=False, border=0)
-                scrollable_html = f'''
-                <div style="max-height: 200px; overflow-y: auto;">
-                    {table_html}
-                </div>
-                '''
-
-                data_text = scrollable_html
-
-            if data_text:
-                popup = folium.Popup(data_text, max_width=500)
-                polygon.add_child(popup)
-
-            if show_samples_per_hexagon and hexagon in samples_per_hexagon:
-                # Calculate the center of the polygon
-                latitudes = [point[0] for point in part]
-                longitudes = [point[1] for point in part]
-                center_lat = sum(latitudes) / len(latitudes)
-                center_lon = sum(longitudes) / len(longitudes)
+    if len(hex_dict) == 0:
+        return m
+
+    if features is None:
+        features = get_sample_hexagon_features(hex_dict, annotation_df)
 
+    if show_samples_per_hexagon:
+        for hexagon in hex_dict:
+            if hexagon not in samples_per_hexagon:
+                continue
+            for center_lat, center_lon in get_hexagon_centers(hexagon):
                 # Add a marker at the center with the number of samples
                 folium.Marker(
                     location=(center_lat, center_lon),
                     icon=folium.DivIcon(html=f'<div style="font-size: 12px; color: grey;">{samples_per_hexagon[hexagon]}</div>')
                 ).add_to(m)
 
+    layer = folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        style_function=lambda feature: {"color": color, "weight": 1, "fillOpacity": 0.0, "fill": True},
+    )
+    folium.GeoJsonTooltip(fields=["tooltip"], labels=False).add_to(layer)
+    folium.GeoJsonPopup(fields=["popup"], labels=False, maxWidth=500).add_to(layer)
+    layer.add_to(m)
+
     return m
 
 
 def draw_hexagons(hexagons, m=None, color='white', zoom_start=1, value=None, opacity=0.3, imputed=False):
     """
-    Draws hexagons on a map.
+    Draws hexagons on a map as a single GeoJson layer.
 
     Parameters:
         hexagons (list): A list of hexagon H3 indices to be plotted.
@@ -140,37 +226,55 @@ def draw_hexagons(hexagons, m=None, color='white', zoom_start=1, value=None, opa
     if m is None:
         m = folium.Map(location=(0.0, 0.0), tiles="Esri worldstreetmap", zoom_start=zoom_start)
 
-    for hexagon in hexagons:
-        parts = split_hexagon_if_needed(hexagon)
-        for part in parts:
-            polygon = folium.Polygon(
-                locations=part,
-                weight=0,
-                color=None,
-                fill_color=color,
-                fill_opacity=opacity,
-                fill=True
-            )
-            # Add imputed to tooltip if `imputed` is True
-            tooltip_text = f"{value} (Imputed)" if imputed else str(value)
-            polygon.add_child(folium.Tooltip(tooltip_text))                
-            polygon.add_to(m)
+    if len(hexagons) == 0:
+        return m
+
+    features = [get_hexagon_feature(hexagon) for hexagon in hexagons]
+    # Add imputed to tooltip if `imputed` is True
+    tooltip_text = f"{value} (Imputed)" if imputed else str(value)
+    folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        style_function=lambda feature: {"color": None, "weight": 0, "fillColor": color, "fillOpacity": opacity, "fill": True},
+        tooltip=folium.Tooltip(tooltip_text),
+    ).add_to(m)
 
     return m
 
 
-from matplotlib import cm, colors as mcolors
+def get_value_colors(values):
+    """
+    Maps distance values to colors of the color gradient in one vectorized step.
 
-def get_color_gradient():
+    Parameters:
+        values (np.ndarray): The distance values, assumed to be between -1 and 1.
+
+    Returns:
+        np.ndarray: An array of shape (N, 3) with the RGB colors as integers between 0 and 255.
     """
-    Returns a colormap for gradient coloring.
+    # Normalize the values for the colormap (assuming values are between -1 and 1)
+    rgba = get_color_gradient()((np.asarray(values, dtype=float) + 1) / 2)
+    return np.round(rgba[:, :3] * 255).astype(int)
+
+
+def get_hex_colors(values):
     """
-    return cm.get_cmap('coolwarm')  # Example colormap
+    Maps distance values to hex color strings of the color gradient.
+
+    Parameters:
+        values (np.ndarray): The distance values, assumed to be between -1 and 1.
+
+    Returns:
+        list: The hex color string for each value.
+    """
+    return ["#{:02x}{:02x}{:02x}".format(*rgb) for rgb in get_value_colors(values)]
+
 
 def draw_hexagons_with_values(hex_dict, m=None, zoom_start=1, threshold=0.0, imputed=False, opacity=0.5):
     """
     Draws hexagons on a map with values determining their fill color.
 
+    All hexagons are added as one GeoJson layer, with the color and tooltip stored in the properties of each feature.
+
     Parameters:
         hex_dict (dict): A dictionary where keys are hexagon H3 indices and 
                          values are the distance values determining color and tooltip.
@@ -185,28 +289,29 @@ def draw_hexagons_with_values(hex_dict, m=None, zoom_start=1, threshold=0.0, imp
     Returns:
         folium.Map: The map object with the plotted hexagons.
     """
-    hexagons = hex_dict.keys()
-    values = hex_dict.values()
+    if m is None:
+        m = folium.Map(location=(0.0, 0.0), tiles="Esri worldstreetmap", zoom_start=zoom_start)
 
-    cmap = get_color_gradient()
+    # Keep only the hexagons with a value that is not below the threshold
+    values = np.fromiter(hex_dict.values(), dtype=float, count=len(hex_dict))
+    mask = ~(values < threshold)
+    colors = get_hex_colors(values[mask])
 
-    for hexagon, value in zip(hexagons, values):
-        if value < threshold:
-            continue
+    features = []
+    for (hexagon, value), color in zip(compress(hex_dict.items(), mask), colors):
+        # Add imputed to tooltip if `imputed` is True
+        tooltip_text = f"{value} (Imputed)" if imputed else str(value)
+        features.append(get_hexagon_feature(hexagon, color=color, tooltip=tooltip_text))
 
-        # Normalize the value for the colormap (assuming values are between -1 and 1)
-        normalized_value = (value + 1) / 2
-        color = mcolors.to_hex(cmap(normalized_value))  # Convert to a hex color
+    if len(features) == 0:
+        return m
 
-        m = draw_hexagons(
-            [hexagon],
-            m,
-            color=color,
-            zoom_start=zoom_start,
-            value=value,
-            opacity=opacity,
-            imputed=imputed
-        )
+    layer = folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        style_function=lambda feature: {"color": None, "weight": 0, "fillColor": feature["properties"]["color"], "fillOpacity": opacity, "fill": True},
+    )
+    folium.GeoJsonTooltip(fields=["tooltip"], labels=False).add_to(layer)
+    layer.add_to(m)
 
     return m
 
@@ -215,6 +320,8 @@ def draw_barriers(barriers_dict, m=None, zoom_start=1, threshold=0.0):
     """
     Draws barriers on a map with colors based on their values.
 
+    All barriers are added as one GeoJson layer of two-point lines.
+
     Parameters:
         barriers_dict (dict): A dictionary where keys are barrier coordinates 
                               (list of tuples) and values are the distance values 
@@ -230,34 +337,97 @@ def draw_barriers(barriers_dict, m=None, zoom_start=1, threshold=0.0):
     if m is None:
         m = folium.Map(location=(0.0, 0.0), tiles="Esri worldstreetmap", zoom_start=zoom_start)
 
-    cmap = get_color_gradient()
-
-    for barrier, value in barriers_dict.items():
-        if value < threshold:
-            continue
-
-        # Normalize value for colormap
-        normalized_value = (value + 1) / 2  # Adjust based on expected value range
-        color = mcolors.to_hex(cmap(normalized_value))
+    # Keep only the barriers with a value that is not below the threshold
+    values = np.fromiter(barriers_dict.values(), dtype=float, count=len(barriers_dict))
+    mask = ~(values < threshold)
+    colors = get_hex_colors(values[mask])
 
+    features = []
+    for (barrier, value), color in zip(compress(barriers_dict.items(), mask), colors):
         try:
-            # Create a PolyLine for the barrier
-            polyline = folium.PolyLine(
-                locations=barrier,
-                color=color,
-                weight=3,  # Line thickness
-                opacity=0.7  # Line transparency
-            )
-            # Add a tooltip showing the value
-            tooltip_text = f"Value: {value:.2f}"
-            polyline.add_child(folium.Tooltip(tooltip_text))
-            polyline.add_to(m)
+            # Create a LineString for the barrier with longitude-latitude pairs
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": [[round(lon, 5), round(lat, 5)] for lat, lon in barrier]},
+                "properties": {"color": color, "tooltip": f"Value: {value:.2f}"},
+            })
         except Exception as e:
             print(f"Error drawing barrier {barrier}: {e}")
 
+    if len(features) == 0:
+        return m
+
+    layer = folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        style_function=lambda feature: {
+            "color": feature["properties"]["color"],
+            "weight": 3,  # Line thickness
+            "opacity": 0.7,  # Line transparency
+        },
+    )
+    # Add a tooltip showing the value
+    folium.GeoJsonTooltip(fields=["tooltip"], labels=False).add_to(layer)
+    layer.add_to(m)
+
     return m
 
 
+def draw_hexagons_deck(hex_dict, imputed_hex, sample_hexagons, lat=0.0, lon=0.0, zoom=1, threshold=0.0, opacity=0.4):
+    """
+    Draws hexagons with values on a Deck.gl map, which renders the hexagons on the GPU.
+
+    Parameters:
+        hex_dict (dict): A dictionary where keys are hexagon H3 indices and 
+                         values are the distance values determining color and tooltip.
+        imputed_hex (dict): A dictionary of imputed hexagons in the same format as hex_dict.
+        sample_hexagons (iterable): The H3 indices of the hexagons that contain samples, drawn as outlines.
+        lat (float, optional): The latitude of the initial view. Defaults to 0.0.
+        lon (float, optional): The longitude of the initial view. Defaults to 0.0.
+        zoom (int, optional): The initial zoom level of the map. Defaults to 1.
+        threshold (float, optional): The minimum value required to plot a hexagon. Defaults to 0.0.
+        opacity (float, optional): The fill opacity of the hexagons. Defaults to 0.4.
+
+    Returns:
+        pydeck.Deck: The Deck object with the plotted hexagons.
+    """
+    rows = []
+    for values, imputed in ((hex_dict, False), (imputed_hex, True)):
+        # Keep only the hexagons with a value that is not below the threshold
+        array = np.fromiter(values.values(), dtype=float, count=len(values))
+        mask = ~(array < threshold)
+        alpha = int(opacity * 255)
+
+        for (hexagon, value), (r, g, b) in zip(compress(values.items(), mask), get_value_colors(array[mask])):
+            # Add imputed to tooltip if `imputed` is True
+            tooltip_text = f"{value} (Imputed)" if imputed else str(value)
+            rows.append((hexagon, [int(r), int(g), int(b), alpha], tooltip_text))
+
+    value_layer = pdk.Layer(
+        "H3HexagonLayer",
+        data=pd.DataFrame(rows, columns=["hex", "color", "tooltip"]),
+        get_hexagon="hex",
+        get_fill_color="color",
+        stroked=False,
+        pickable=True,
+    )
+    sample_layer = pdk.Layer(
+        "H3HexagonLayer",
+        data=pd.DataFrame({"hex": list(sample_hexagons), "tooltip": "Hexagon with samples"}),
+        get_hexagon="hex",
+        filled=False,
+        stroked=True,
+        get_line_color=[128, 128, 128],
+        line_width_min_pixels=1,
+    )
+
+    return pdk.Deck(
+        layers=[value_layer, sample_layer],
+        initial_view_state=pdk.ViewState(latitude=lat, longitude=lon, zoom=zoom),
+        map_style="light",
+        tooltip={"text": "{tooltip}"},
+    )
+
+
 def draw_migration_for_time_bin(time_bin, m, color="green"):
     """
     Draw migration paths for hexagon pairs within a specified time bin on a given map.
@@ -284,8 +454,9 @@ def draw_migration_for_time_bin(time_bin, m, color="green"):
 
     for pair, distance in time_bin.items():
         hex1, hex2 = pair
-        midpoint1 = h3.cell_to_latlng(hex1)  
-        midpoint2 = h3.cell_to_latlng(hex2)  
+        # the centers are cached, since most hexagons are on more than one path
+        midpoint1 = get_hex_center(hex1)
+        midpoint2 = get_hex_center(hex2)
 
         # Handle antimeridian crossing
         if abs(midpoint1[1] - midpoint2[1]) > 180:
@@ -7,7 +7,6 @@ ENV_NAME="stargen"
 CONDA_PACKAGES=(
     "python=3.12.2"
     "streamlit=1.32.0"
-    "streamlit-folium=0.20.0"
     "folium=0.16.0"
     "pandas=2.2.1"
     "numpy=1.26.4"